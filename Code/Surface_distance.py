@@ -1,12 +1,53 @@
 import argparse
+import functools
 import logging
+import math
+import multiprocessing
 import os
 import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import accumulate, repeat
+from multiprocessing import shared_memory
 
 import nibabel as nib
 import numpy as np
 import scipy.ndimage
-from sklearn import metrics
+import scipy.spatial
+
+try:
+	from numba import config as numba_config
+	from numba import njit, prange, set_num_threads, types
+except ImportError:  # numba is optional, fall back to NumPy
+	njit = None
+
+try:
+	import edt
+except ImportError:  # edt is optional, fall back to scipy
+	edt = None
+
+try:
+	import cupy
+	import cupyx.scipy.ndimage
+except ImportError:  # cupy is optional, the distance transforms and counts then run on the CPU
+	cupy = None
+
+_GPU_AVAILABLE = cupy is not None and cupy.cuda.is_available()
+
+# cores this process may run on. The affinity mask (e.g. of a cpuset limited
+# container or a Slurm job) can be smaller than os.cpu_count(), and Numba
+# never runs more than NUMBA_NUM_THREADS threads
+if hasattr(os, "sched_getaffinity"):
+	_CPU_COUNT = len(os.sched_getaffinity(0))
+else:
+	_CPU_COUNT = os.cpu_count() or 1
+if njit is not None:
+	_CPU_COUNT = min(_CPU_COUNT, numba_config.NUMBA_NUM_THREADS)
+
+# threads used by the edt distance transforms (the Numba kernels have their
+# own setting), see _set_num_threads
+_NUM_THREADS = _CPU_COUNT
 
 # neighbour_code_to_normals is a lookup table.
 # For every binary neighbour code
@@ -339,8 +380,335 @@ neighbour_code_to_normals = [
 	[[0.125, 0.125, 0.125]],
 	[[0, 0, 0]]]
 
+# flattened version of neighbour_code_to_normals: all normals stacked into a
+# single (n_normals, 3) array, the normals of code `c` are found in the rows
+# _OFFSETS[c]:_OFFSETS[c + 1]. Only these two arrays are used at runtime, the
+# nested list above is kept as the readable source of the table and dropped
+# once it has been flattened
+_NORMALS = np.array([normal for normals in neighbour_code_to_normals for normal in normals],
+                    dtype = np.float32)
+_OFFSETS = np.cumsum([0] + [len(normals) for normals in neighbour_code_to_normals],
+                     dtype = np.int32)
+_NORMALS.setflags(write = False)
+_OFFSETS.setflags(write = False)
+del neighbour_code_to_normals
+
+
+@functools.lru_cache(maxsize = None)
+def _build_area_table(spacing_mm):
+	"""Compute the area for all 256 possible surface elements.
+
+	The table only depends on the voxel spacing, so it is cached for every
+	distinct `spacing_mm` (which therefore has to be a hashable tuple).
+	"""
+	scale = np.array([spacing_mm[1] * spacing_mm[2],
+	                  spacing_mm[0] * spacing_mm[2],
+	                  spacing_mm[0] * spacing_mm[1]])
+	normals = _NORMALS * scale
+	areas = np.sqrt((normals * normals).sum(axis = 1))
+	neighbour_code_to_surface_area = np.add.reduceat(areas, _OFFSETS[:-1]).astype(np.float32)
+	neighbour_code_to_surface_area.setflags(write = False)
+	return neighbour_code_to_surface_area
+
+
+@dataclass
+class _Scratch:
+	"""Buffers reused by consecutive calls of compute_surface_distances.
+
+	Every buffer is a flat array that only grows, `view` hands out a
+	reshaped view on its first elements. This avoids allocating (and
+	zeroing) the full and cropped volumes again for every case.
+	"""
+	mask_all: np.ndarray = field(default_factory = lambda: np.empty(0, bool))
+	code_map_gt: np.ndarray = field(default_factory = lambda: np.empty(0, np.uint8))
+	code_map_pred: np.ndarray = field(default_factory = lambda: np.empty(0, np.uint8))
+	borders_gt: np.ndarray = field(default_factory = lambda: np.empty(0, bool))
+	borders_pred: np.ndarray = field(default_factory = lambda: np.empty(0, bool))
+	not_borders: np.ndarray = field(default_factory = lambda: np.empty(0, bool))
+	distmap: np.ndarray = field(default_factory = lambda: np.empty(0, np.float64))
+
+	def view(self, name, shape):
+		buffer = getattr(self, name)
+		size = int(np.prod(shape))
+		if buffer.size < size:
+			buffer = np.empty(size, buffer.dtype)
+			setattr(self, name, buffer)
+		return buffer[:size].reshape(shape)
+
+
+_thread_local = threading.local()
+
+
+def _set_num_threads(n_threads):
+	"""Limit the threads of the distance transforms and Numba kernels of this process."""
+	global _NUM_THREADS
+	n_threads = max(1, min(n_threads, _CPU_COUNT))
+	_NUM_THREADS = n_threads
+	if njit is not None:
+		set_num_threads(n_threads)
+
+
+def _default_scratch():
+	"""Return the scratch buffers of the calling thread."""
+	if not hasattr(_thread_local, "scratch"):
+		_thread_local.scratch = _Scratch()
+	return _thread_local.scratch
+
+
+# the Numba kernels are compiled eagerly for the signatures used here and
+# cached on disk, so only the very first run pays for the compilation and
+# every later process (e.g. the driver's workers) just loads them.
+# The inputs are declared read-only, so both writable and read-only arrays
+# (e.g. memory-mapped images) match the signatures
+if njit is not None:
+	@njit([types.void(types.Array(types.boolean, 3, "A", readonly = True), types.uint8[:, :, ::1])],
+	      parallel = True, fastmath = True, cache = True, boundscheck = False)
+	def _neighbour_code_map(mask, code_map):
+		"""Compute the neighbour code (local binary pattern) of a cropped mask.
+
+		`mask` is treated as if it was zero padded by one voxel on every side,
+		so `code_map` has to be one voxel larger than `mask` along every axis.
+		Every output voxel packs its 2x2x2 neighbourhood into one byte.
+		"""
+		n0, n1, n2 = mask.shape
+		for i in prange(n0 + 1):
+			for j in range(n1 + 1):
+				code_map[i, j, :] = 0
+				# OR the four rows of the neighbourhood into the output row,
+				# rows outside of the mask belong to the padding
+				for di in range(2):
+					si = i - 1 + di
+					if si < 0 or si >= n0:
+						continue
+					for dj in range(2):
+						sj = j - 1 + dj
+						if sj < 0 or sj >= n1:
+							continue
+						shift = 6 - 4 * di - 2 * dj
+						for k in range(n2):
+							bit = np.uint8(mask[si, sj, k])
+							code_map[i, j, k] |= bit << shift
+							code_map[i, j, k + 1] |= bit << (shift + 1)
+else:
+	def _neighbour_code_map(mask, code_map):
+		"""Compute the neighbour code (local binary pattern) of a cropped mask.
+
+		`mask` is treated as if it was zero padded by one voxel on every side,
+		so `code_map` has to be one voxel larger than `mask` along every axis.
+		Every output voxel packs its 2x2x2 neighbourhood into one byte.
+		"""
+		cropmask = np.zeros(np.add(mask.shape, 2), np.uint8)
+		cropmask[1:-1, 1:-1, 1:-1] = mask
+		# OR the eight shifted views of the padded mask into the code map,
+		# the voxel at offset (0, 0, 0) is the highest bit
+		n0, n1, n2 = code_map.shape
+		shifted = np.empty_like(code_map)
+		code_map.fill(0)
+		for bit in range(8):
+			di, dj, dk = (7 - bit) >> 2, ((7 - bit) >> 1) & 1, (7 - bit) & 1
+			code_map |= np.left_shift(cropmask[di:di + n0, dj:dj + n1, dk:dk + n2], bit, out = shifted)
+
+
+if njit is not None:
+	@njit(["void(u1[:, :, ::1], b1[:, :, ::1])"],
+	      parallel = True, fastmath = True, cache = True, boundscheck = False)
+	def _surface_borders(code_map, borders):
+		"""Mark the surface voxels, i.e. the neighbour codes other than 0 and 255."""
+		n0, n1, n2 = code_map.shape
+		for i in prange(n0):
+			for j in range(n1):
+				for k in range(n2):
+					code = code_map[i, j, k]
+					borders[i, j, k] = (code != 0) & (code != 255)
+else:
+	def _surface_borders(code_map, borders):
+		"""Mark the surface voxels, i.e. the neighbour codes other than 0 and 255."""
+		np.not_equal(code_map, 0, out = borders)
+		borders &= code_map != 255
+
+
+if njit is not None:
+	@njit([types.UniTuple(types.float64, 5)(types.Array(dtype, 1, "A", readonly = True),
+	                                        types.Array(dtype, 1, "A", readonly = True),
+	                                        types.float64, types.float64)
+	       for dtype in (types.float32, types.float64)],
+	      cache = True)
+	def _surface_metrics(distances, areas, percent, tolerance_mm):
+		"""Summarise the sorted distances and areas of one surface.
+
+		Returns the total area, the area weighted sum of the distances, the area
+		within `tolerance_mm`, the `percent` percentile and the maximum of the
+		distances. The sums are streamed in one pass, a second one stops at
+		the percentile.
+		"""
+		n = distances.shape[0]
+		if n == 0:
+			return 0.0, 0.0, 0.0, np.inf, np.inf
+		total = 0.0
+		weighted_sum = 0.0
+		area_within = 0.0
+		for i in range(n):
+			total += areas[i]
+			weighted_sum += np.float64(distances[i]) * areas[i]
+			if distances[i] <= tolerance_mm:
+				area_within = total
+		target = percent / 100.0 * total
+		partial = 0.0
+		perc_distance = distances[n - 1]
+		for i in range(n):
+			partial += areas[i]
+			if partial >= target:
+				perc_distance = distances[i]
+				break
+		return total, weighted_sum, area_within, perc_distance, distances[n - 1]
+else:
+	def _surface_metrics(distances, areas, percent, tolerance_mm):
+		"""Summarise the sorted distances and areas of one surface.
+
+		Returns the total area, the area weighted sum of the distances, the area
+		within `tolerance_mm`, the `percent` percentile and the maximum of the
+		distances.
+		"""
+		n = len(distances)
+		if n == 0:
+			return 0.0, 0.0, 0.0, np.inf, np.inf
+		surfel_areas_cum = np.cumsum(areas, dtype = np.float64)
+		total = surfel_areas_cum[-1]
+		n_within = np.searchsorted(distances, tolerance_mm, side = "right")
+		area_within = surfel_areas_cum[n_within - 1] if n_within > 0 else 0.0
+		idx = np.searchsorted(surfel_areas_cum, percent / 100.0 * total)
+		return (total, np.dot(distances.astype(np.float64), areas), area_within,
+		        distances[min(idx, n - 1)], distances[-1])
+
+
+def _distance_transform(not_borders, spacing_mm, scratch):
+	"""Compute the distance of every voxel to the closest zero of `not_borders`.
+
+	Uses the multi-threaded `edt` package when it is installed and scipy
+	otherwise. The returned map may be a view into the scratch buffers.
+	"""
+	if edt is not None:
+		# black_border has to stay off, the edge of the cropped volume is not
+		# part of any surface. edt computes the map in float32 already, only
+		# scipy is limited to float64
+		return edt.edt(not_borders.view(np.uint8), anisotropy = tuple(spacing_mm),
+		               black_border = False, parallel = _NUM_THREADS)
+
+	distmap = scratch.view("distmap", not_borders.shape)
+	scipy.ndimage.morphology.distance_transform_edt(
+		not_borders, sampling = spacing_mm, distances = distmap)
+	return distmap
+
+
+def _surface_distances_cpu(borders_gt, borders_pred, spacing_mm, scratch):
+	"""Compute the distances from each surface voxel to the other surface."""
+	# compute the distance transform (closest distance of each voxel to the surface voxels)
+	# both transforms share the buffer for the inverted border mask, the
+	# distances are gathered right after each transform
+	not_borders = scratch.view("not_borders", borders_gt.shape)
+	# if the other surface is empty all distances are inf, which does not
+	# need a distance map at all
+	if borders_pred.any():
+		distmap = _distance_transform(
+			np.logical_not(borders_pred, out = not_borders), spacing_mm, scratch)
+		# millimetre distances do not need double precision, keeping them in
+		# float32 halves the memory traffic of the gather, sort and sums
+		distances_gt_to_pred = distmap[borders_gt].astype(np.float32, copy = False)
+	else:
+		distances_gt_to_pred = np.full(np.count_nonzero(borders_gt), np.inf, np.float32)
+
+	if borders_gt.any():
+		distmap = _distance_transform(
+			np.logical_not(borders_gt, out = not_borders), spacing_mm, scratch)
+		distances_pred_to_gt = distmap[borders_pred].astype(np.float32, copy = False)
+	else:
+		distances_pred_to_gt = np.full(np.count_nonzero(borders_pred), np.inf, np.float32)
+
+	return distances_gt_to_pred, distances_pred_to_gt
+
+
+def _surface_distances_gpu(borders_gt, borders_pred, spacing_mm):
+	"""Compute the distances from each surface voxel to the other surface on the GPU.
 
-def compute_surface_distances(mask_gt, mask_pred, spacing_mm):
+	Both border masks stay on the device for the two distance transforms,
+	which are computed in float32, only the distances at the surface voxels
+	are copied back to the host.
+	"""
+	borders_gt = cupy.asarray(borders_gt)
+	borders_pred = cupy.asarray(borders_pred)
+	if borders_pred.any():
+		distmap_pred = cupyx.scipy.ndimage.distance_transform_edt(
+			cupy.logical_not(borders_pred), sampling = spacing_mm, float64_distances = False)
+		distances_gt_to_pred = cupy.asnumpy(distmap_pred[borders_gt])
+	else:
+		distances_gt_to_pred = np.full(int(cupy.count_nonzero(borders_gt)), np.inf, np.float32)
+
+	if borders_gt.any():
+		distmap_gt = cupyx.scipy.ndimage.distance_transform_edt(
+			cupy.logical_not(borders_gt), sampling = spacing_mm, float64_distances = False)
+		distances_pred_to_gt = cupy.asnumpy(distmap_gt[borders_pred])
+	else:
+		distances_pred_to_gt = np.full(int(cupy.count_nonzero(borders_pred)), np.inf, np.float32)
+
+	return distances_gt_to_pred, distances_pred_to_gt
+
+
+def _extract_surfaces(mask_gt, mask_pred, scratch):
+	"""Find the surface voxels of both masks within their bounding box.
+
+	Returns the bounding box (min and max corner), the neighbour code maps and
+	the surface masks of the ground truth and the prediction (views of the
+	scratch buffers, shifted by minus half a voxel), or None if both masks
+	are empty.
+	"""
+	# the neighbour code kernel takes 0/1 bool masks, other dtypes are
+	# converted (bool masks are passed through without a copy)
+	mask_gt = np.asarray(mask_gt, dtype = bool)
+	mask_pred = np.asarray(mask_pred, dtype = bool)
+
+	# compute the bounding box of the masks to trim
+	# the volume to the smallest possible processing subvolume
+	mask_all = np.logical_or(mask_gt, mask_pred, out = scratch.view("mask_all", mask_gt.shape))
+	# projections of the union mask onto each axis. The projection onto the
+	# x0/x1-plane is shared by the first two axes, so the volume is only
+	# scanned twice instead of three times
+	proj_01 = np.any(mask_all, axis = 2)
+	projections = (np.any(proj_01, axis = 1),
+	               np.any(proj_01, axis = 0),
+	               np.any(mask_all, axis = (0, 1)))
+	if not projections[0].any():
+		return None
+
+	bbox_min = np.zeros(3, np.int64)
+	bbox_max = np.zeros(3, np.int64)
+	for axis, proj in enumerate(projections):
+		bbox_min[axis], bbox_max[axis] = np.flatnonzero(proj)[[0, -1]]
+
+	# crop the processing subvolume.
+	# the neighbour code map is computed directly on the cropped views, which
+	# are treated as zero padded by 1 voxel on every side. This is required to
+	# obtain the "full" convolution result with the 2x2x2 kernel
+	bbox = tuple(slice(lo, hi + 1) for lo, hi in zip(bbox_min, bbox_max))
+
+	# compute the neighbour code (local binary pattern) for each voxel
+	# the resultsing arrays are spacially shifted by minus half a voxel in each axis.
+	# i.e. the points are located at the corners of the original voxels
+	code_map_shape = tuple(bbox_max - bbox_min + 2)
+	neighbour_code_map_gt = scratch.view("code_map_gt", code_map_shape)
+	neighbour_code_map_pred = scratch.view("code_map_pred", code_map_shape)
+	_neighbour_code_map(mask_gt[bbox], neighbour_code_map_gt)
+	_neighbour_code_map(mask_pred[bbox], neighbour_code_map_pred)
+
+	# create masks with the surface voxels
+	borders_gt = scratch.view("borders_gt", code_map_shape)
+	borders_pred = scratch.view("borders_pred", code_map_shape)
+	_surface_borders(neighbour_code_map_gt, borders_gt)
+	_surface_borders(neighbour_code_map_pred, borders_pred)
+
+	return bbox_min, bbox_max, neighbour_code_map_gt, neighbour_code_map_pred, borders_gt, borders_pred
+
+
+def compute_surface_distances(mask_gt, mask_pred, spacing_mm, scratch = None):
 	"""Compute closest distances from all surface points to the other surface.
 
 	Finds all surface elements "surfels" in the ground truth mask `mask_gt` and
@@ -355,6 +723,8 @@ def compute_surface_distances(mask_gt, mask_pred, spacing_mm):
 	  mask_pred: 3-dim Numpy array of type bool. The predicted mask.
 	  spacing_mm: 3-element list-like structure. Voxel spacing in x0, x1 and x2
 		  direction
+	  scratch: optional _Scratch with buffers to reuse. Defaults to the buffers
+		  of the calling thread
 
 	Returns:
 	  A dict with
@@ -370,194 +740,139 @@ def compute_surface_distances(mask_gt, mask_pred, spacing_mm):
 	  "surfel_areas_pred": 1-dim numpy array of type float. The area in mm^2 of
 		  the predicted surface elements in the same order as
 		  distances_pred_to_gt
+	  "bbox_min", "bbox_max": 3-element numpy arrays of type int. The corners of
+		  the bounding box of both masks (inclusive), None if both are empty
 
 	"""
 
 	# compute the area for all 256 possible surface elements
 	# (given a 2x2x2 neighbourhood) according to the spacing_mm
-	neighbour_code_to_surface_area = np.zeros([256])
-	for code in range(256):
-		normals = np.array(neighbour_code_to_normals[code])
-		sum_area = 0
-		for normal_idx in range(normals.shape[0]):
-			# normal vector
-			n = np.zeros([3])
-			n[0] = normals[normal_idx, 0] * spacing_mm[1] * spacing_mm[2]
-			n[1] = normals[normal_idx, 1] * spacing_mm[0] * spacing_mm[2]
-			n[2] = normals[normal_idx, 2] * spacing_mm[0] * spacing_mm[1]
-			area = np.linalg.norm(n)
-			sum_area += area
-		neighbour_code_to_surface_area[code] = sum_area
-
-	# compute the bounding box of the masks to trim
-	# the volume to the smallest possible processing subvolume
-	mask_all = mask_gt | mask_pred
-	bbox_min = np.zeros(3, np.int64)
-	bbox_max = np.zeros(3, np.int64)
-
-	# max projection to the x0-axis
-	proj_0 = np.max(np.max(mask_all, axis = 2), axis = 1)
-	idx_nonzero_0 = np.nonzero(proj_0)[0]
-	if len(idx_nonzero_0) == 0:
-		return {"distances_gt_to_pred": np.array([]),
-		        "distances_pred_to_gt": np.array([]),
-		        "surfel_areas_gt": np.array([]),
-		        "surfel_areas_pred": np.array([])}
-
-	bbox_min[0] = np.min(idx_nonzero_0)
-	bbox_max[0] = np.max(idx_nonzero_0)
-
-	# max projection to the x1-axis
-	proj_1 = np.max(np.max(mask_all, axis = 2), axis = 0)
-	idx_nonzero_1 = np.nonzero(proj_1)[0]
-	bbox_min[1] = np.min(idx_nonzero_1)
-	bbox_max[1] = np.max(idx_nonzero_1)
-
-	# max projection to the x2-axis
-	proj_2 = np.max(np.max(mask_all, axis = 1), axis = 0)
-	idx_nonzero_2 = np.nonzero(proj_2)[0]
-	bbox_min[2] = np.min(idx_nonzero_2)
-	bbox_max[2] = np.max(idx_nonzero_2)
-
-	print("bounding box min = {}".format(bbox_min))
-	print("bounding box max = {}".format(bbox_max))
-
-	# crop the processing subvolume.
-	# we need to zeropad the cropped region with 1 voxel at the lower,
-	# the right and the back side. This is required to obtain the "full"
-	# convolution result with the 2x2x2 kernel
-	cropmask_gt = np.zeros((bbox_max - bbox_min) + 2, np.uint8)
-	cropmask_pred = np.zeros((bbox_max - bbox_min) + 2, np.uint8)
-
-	cropmask_gt[0:-1, 0:-1, 0:-1] = mask_gt[bbox_min[0]:bbox_max[0] + 1,
-	                                bbox_min[1]:bbox_max[1] + 1,
-	                                bbox_min[2]:bbox_max[2] + 1]
-
-	cropmask_pred[0:-1, 0:-1, 0:-1] = mask_pred[bbox_min[0]:bbox_max[0] + 1,
-	                                  bbox_min[1]:bbox_max[1] + 1,
-	                                  bbox_min[2]:bbox_max[2] + 1]
-
-	# compute the neighbour code (local binary pattern) for each voxel
-	# the resultsing arrays are spacially shifted by minus half a voxel in each axis.
-	# i.e. the points are located at the corners of the original voxels
-	kernel = np.array([[[128, 64],
-	                    [32, 16]],
-	                   [[8, 4],
-	                    [2, 1]]])
-	neighbour_code_map_gt = scipy.ndimage.filters.correlate(
-		cropmask_gt.astype(np.uint8), kernel, mode = "constant", cval = 0)
-	neighbour_code_map_pred = scipy.ndimage.filters.correlate(
-		cropmask_pred.astype(np.uint8), kernel, mode = "constant", cval = 0)
-
-	# create masks with the surface voxels
-	borders_gt = ((neighbour_code_map_gt != 0) &
-	              (neighbour_code_map_gt != 255))
-	borders_pred = ((neighbour_code_map_pred != 0) &
-	                (neighbour_code_map_pred != 255))
-
-	# compute the distance transform (closest distance of each voxel to the surface voxels)
-	if borders_gt.any():
-		distmap_gt = scipy.ndimage.morphology.distance_transform_edt(
-			~borders_gt, sampling = spacing_mm)
-	else:
-		distmap_gt = np.Inf * np.ones(borders_gt.shape)
-
-	if borders_pred.any():
-		distmap_pred = scipy.ndimage.morphology.distance_transform_edt(
-			~borders_pred, sampling = spacing_mm)
+	neighbour_code_to_surface_area = _build_area_table(tuple(spacing_mm))
+
+	if scratch is None:
+		scratch = _default_scratch()
+
+	surfaces = _extract_surfaces(mask_gt, mask_pred, scratch)
+	if surfaces is None:
+		return {"distances_gt_to_pred": np.array([], np.float32),
+		        "distances_pred_to_gt": np.array([], np.float32),
+		        "surfel_areas_gt": np.array([], np.float32),
+		        "surfel_areas_pred": np.array([], np.float32),
+		        "bbox_min": None,
+		        "bbox_max": None}
+	bbox_min, bbox_max, neighbour_code_map_gt, neighbour_code_map_pred, borders_gt, borders_pred = surfaces
+
+	# compute the closest distance of each surface voxel to the other surface
+	if _GPU_AVAILABLE:
+		distances_gt_to_pred, distances_pred_to_gt = _surface_distances_gpu(
+			borders_gt, borders_pred, spacing_mm)
 	else:
-		distmap_pred = np.Inf * np.ones(borders_pred.shape)
-
-	# compute the area of each surface element
-	surface_area_map_gt = neighbour_code_to_surface_area[neighbour_code_map_gt]
-	surface_area_map_pred = neighbour_code_to_surface_area[neighbour_code_map_pred]
+		distances_gt_to_pred, distances_pred_to_gt = _surface_distances_cpu(
+			borders_gt, borders_pred, spacing_mm, scratch)
 
 	# create a list of all surface elements with distance and area
-	distances_gt_to_pred = distmap_pred[borders_gt]
-	distances_pred_to_gt = distmap_gt[borders_pred]
-	surfel_areas_gt = surface_area_map_gt[borders_gt]
-	surfel_areas_pred = surface_area_map_pred[borders_pred]
+	# (only the codes of the surface voxels are looked up in the area table)
+	surfel_areas_gt = neighbour_code_to_surface_area[neighbour_code_map_gt[borders_gt]]
+	surfel_areas_pred = neighbour_code_to_surface_area[neighbour_code_map_pred[borders_pred]]
 
 	# sort them by distance
-	if distances_gt_to_pred.shape != (0,):
-		sorted_surfels_gt = np.array(
-			sorted(zip(distances_gt_to_pred, surfel_areas_gt)))
-		distances_gt_to_pred = sorted_surfels_gt[:, 0]
-		surfel_areas_gt = sorted_surfels_gt[:, 1]
-
-	if distances_pred_to_gt.shape != (0,):
-		sorted_surfels_pred = np.array(
-			sorted(zip(distances_pred_to_gt, surfel_areas_pred)))
-		distances_pred_to_gt = sorted_surfels_pred[:, 0]
-		surfel_areas_pred = sorted_surfels_pred[:, 1]
+	order_gt = np.argsort(distances_gt_to_pred, kind = "stable")
+	distances_gt_to_pred = distances_gt_to_pred[order_gt]
+	surfel_areas_gt = surfel_areas_gt[order_gt]
+
+	order_pred = np.argsort(distances_pred_to_gt, kind = "stable")
+	distances_pred_to_gt = distances_pred_to_gt[order_pred]
+	surfel_areas_pred = surfel_areas_pred[order_pred]
 
 	return {"distances_gt_to_pred": distances_gt_to_pred,
 	        "distances_pred_to_gt": distances_pred_to_gt,
 	        "surfel_areas_gt": surfel_areas_gt,
-	        "surfel_areas_pred": surfel_areas_pred}
+	        "surfel_areas_pred": surfel_areas_pred,
+	        "bbox_min": bbox_min,
+	        "bbox_max": bbox_max}
 
 
 def compute_average_surface_distance(surface_distances):
-	distances_gt_to_pred = surface_distances["distances_gt_to_pred"]
-	distances_pred_to_gt = surface_distances["distances_pred_to_gt"]
-	surfel_areas_gt = surface_distances["surfel_areas_gt"]
-	surfel_areas_pred = surface_distances["surfel_areas_pred"]
-	average_distance_gt_to_pred = np.sum(
-		distances_gt_to_pred * surfel_areas_gt) / np.sum(surfel_areas_gt)
-	average_distance_pred_to_gt = np.sum(
-		distances_pred_to_gt * surfel_areas_pred) / np.sum(surfel_areas_pred)
-	return (average_distance_gt_to_pred, average_distance_pred_to_gt)
+	# (percentile 0 ends the kernel's percentile pass right away)
+	return compute_surface_metrics(surface_distances, 0, 0)["average_surface_distance"]
 
 
 def compute_robust_hausdorff(surface_distances, percent):
-	distances_gt_to_pred = surface_distances["distances_gt_to_pred"]
-	distances_pred_to_gt = surface_distances["distances_pred_to_gt"]
-	surfel_areas_gt = surface_distances["surfel_areas_gt"]
-	surfel_areas_pred = surface_distances["surfel_areas_pred"]
-	if len(distances_gt_to_pred) > 0:
-		surfel_areas_cum_gt = np.cumsum(
-			surfel_areas_gt) / np.sum(surfel_areas_gt)
-		idx = np.searchsorted(surfel_areas_cum_gt, percent / 100.0)
-		perc_distance_gt_to_pred = distances_gt_to_pred[min(
-			idx, len(distances_gt_to_pred) - 1)]
-	else:
-		perc_distance_gt_to_pred = np.Inf
-
-	if len(distances_pred_to_gt) > 0:
-		surfel_areas_cum_pred = np.cumsum(
-			surfel_areas_pred) / np.sum(surfel_areas_pred)
-		idx = np.searchsorted(surfel_areas_cum_pred, percent / 100.0)
-		perc_distance_pred_to_gt = distances_pred_to_gt[min(
-			idx, len(distances_pred_to_gt) - 1)]
-	else:
-		perc_distance_pred_to_gt = np.Inf
+	return compute_surface_metrics(surface_distances, percent, 0)["robust_hausdorff"]
 
-	return max(perc_distance_gt_to_pred, perc_distance_pred_to_gt)
+
+def compute_hausdorff_distance(mask_gt, mask_pred, spacing_mm, scratch = None):
+	"""Compute the (100%) Hausdorff distance between the mask surfaces.
+
+	Gives the same result as compute_robust_hausdorff(surface_distances, 100),
+	but compares the surface points directly with the early break algorithm of
+	scipy's directed_hausdorff instead of computing two distance transforms.
+	Use it when only the maximum distance is needed. This is library API only,
+	the evaluation driver below needs the full distance distribution anyway
+	and takes its Hausdorff distance from compute_surface_metrics.
+
+	Args:
+	  mask_gt: 3-dim Numpy array of type bool. The ground truth mask.
+	  mask_pred: 3-dim Numpy array of type bool. The predicted mask.
+	  spacing_mm: 3-element list-like structure. Voxel spacing in x0, x1 and x2
+		  direction
+	  scratch: optional _Scratch with buffers to reuse. Defaults to the buffers
+		  of the calling thread
+
+	Returns:
+	  A float, the Hausdorff distance in mm. `inf` if one of the masks is empty
+	"""
+	if scratch is None:
+		scratch = _default_scratch()
+
+	surfaces = _extract_surfaces(mask_gt, mask_pred, scratch)
+	if surfaces is None:
+		return np.inf
+	_, _, _, _, borders_gt, borders_pred = surfaces
+
+	points_gt = np.argwhere(borders_gt) * np.asarray(spacing_mm, np.float64)
+	points_pred = np.argwhere(borders_pred) * np.asarray(spacing_mm, np.float64)
+	if len(points_gt) == 0 or len(points_pred) == 0:
+		return np.inf
+
+	return max(scipy.spatial.distance.directed_hausdorff(points_gt, points_pred)[0],
+	           scipy.spatial.distance.directed_hausdorff(points_pred, points_gt)[0])
 
 
 def compute_surface_overlap_at_tolerance(surface_distances, tolerance_mm):
-	distances_gt_to_pred = surface_distances["distances_gt_to_pred"]
-	distances_pred_to_gt = surface_distances["distances_pred_to_gt"]
-	surfel_areas_gt = surface_distances["surfel_areas_gt"]
-	surfel_areas_pred = surface_distances["surfel_areas_pred"]
-	rel_overlap_gt = np.sum(
-		surfel_areas_gt[distances_gt_to_pred <= tolerance_mm]) / np.sum(surfel_areas_gt)
-	rel_overlap_pred = np.sum(
-		surfel_areas_pred[distances_pred_to_gt <= tolerance_mm]) / np.sum(surfel_areas_pred)
-	return (rel_overlap_gt, rel_overlap_pred)
+	return compute_surface_metrics(surface_distances, 0, tolerance_mm)["surface_overlap"]
 
 
 def compute_surface_dice_at_tolerance(surface_distances, tolerance_mm):
-	distances_gt_to_pred = surface_distances["distances_gt_to_pred"]
-	distances_pred_to_gt = surface_distances["distances_pred_to_gt"]
-	surfel_areas_gt = surface_distances["surfel_areas_gt"]
-	surfel_areas_pred = surface_distances["surfel_areas_pred"]
-	overlap_gt = np.sum(surfel_areas_gt[distances_gt_to_pred <= tolerance_mm])
-	overlap_pred = np.sum(
-		surfel_areas_pred[distances_pred_to_gt <= tolerance_mm])
-	surface_dice = (overlap_gt + overlap_pred) / (
-			np.sum(surfel_areas_gt) + np.sum(surfel_areas_pred))
-	return surface_dice
+	return compute_surface_metrics(surface_distances, 0, tolerance_mm)["surface_dice"]
+
+
+def compute_surface_metrics(surface_distances, percent, tolerance_mm):
+	"""Compute all surface metrics with one kernel call per surface.
+
+	compute_average_surface_distance, compute_robust_hausdorff,
+	compute_surface_overlap_at_tolerance and compute_surface_dice_at_tolerance
+	are thin wrappers around it. Computing all metrics at once streams the
+	sorted distances and areas of each surface once instead of once per metric.
+
+	Returns:
+	  A dict with "average_surface_distance", "hausdorff_100",
+	  "robust_hausdorff" (at `percent`), "surface_overlap" and "surface_dice"
+	"""
+	total_gt, weighted_sum_gt, area_within_gt, perc_distance_gt_to_pred, max_distance_gt_to_pred = \
+		_surface_metrics(surface_distances["distances_gt_to_pred"],
+		                 surface_distances["surfel_areas_gt"], percent, tolerance_mm)
+	total_pred, weighted_sum_pred, area_within_pred, perc_distance_pred_to_gt, max_distance_pred_to_gt = \
+		_surface_metrics(surface_distances["distances_pred_to_gt"],
+		                 surface_distances["surfel_areas_pred"], percent, tolerance_mm)
+
+	return {"average_surface_distance": (np.divide(weighted_sum_gt, total_gt),
+	                                     np.divide(weighted_sum_pred, total_pred)),
+	        "hausdorff_100": max(max_distance_gt_to_pred, max_distance_pred_to_gt),
+	        "robust_hausdorff": max(perc_distance_gt_to_pred, perc_distance_pred_to_gt),
+	        "surface_overlap": (np.divide(area_within_gt, total_gt),
+	                            np.divide(area_within_pred, total_pred)),
+	        "surface_dice": np.divide(area_within_gt + area_within_pred, total_gt + total_pred)}
 
 
 def compute_dice_coefficient(mask_gt, mask_pred):
@@ -575,124 +890,258 @@ def compute_dice_coefficient(mask_gt, mask_pred):
 	"""
 	volume_sum = mask_gt.sum() + mask_pred.sum()
 	if volume_sum == 0:
-		return np.NaN
+		return np.nan
 	volume_intersect = (mask_gt & mask_pred).sum()
 	return 2 * volume_intersect / volume_sum
 
 
-parser = argparse.ArgumentParser(
-	description = "Run Performance Metrics.")
-parser.add_argument("--gt_folder", default = "",
-                    type = str, help = "ground truth data folder")
-parser.add_argument("--pred_folder", default = "",
-                    type = str, help = "prediction folder")
-parser.add_argument("--overlap", default = False,
-                    type = bool, help = "apply overlap or not?")
-parser.add_argument("--DynUNET", default = "No",
-                    type = str, help = "check if it is DynUNET")
+# number of set bits in each byte value
+_POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], np.uint8)
 
-args = parser.parse_args()
-gt_folder = args.gt_folder
-pred_folder = args.pred_folder
-overlap = args.overlap
 
-logging.basicConfig(stream = sys.stdout, level = logging.INFO)
+def _confusion_counts(gt_packed, pred_packed, n_voxels):
+	"""Count TN, FP, FN and TP of all cases from their bit packed masks.
 
-spacing_mm = (2, 1, 1)
+	The packed masks of all cases are stacked in one buffer and their padding
+	bits are zero, so the whole batch is counted at once, byte by byte and
+	without unpacking: TP is the number of set bits of gt & pred, FN and FP
+	those of gt and pred minus TP, and TN the rest. On the GPU only the packed
+	bytes are transferred.
+	"""
+	if _GPU_AVAILABLE:
+		gt_packed = cupy.asarray(gt_packed)
+		pred_packed = cupy.asarray(pred_packed)
+		popcount = cupy.asarray(_POPCOUNT)
+		TP = int(popcount[gt_packed & pred_packed].sum(dtype = cupy.int64))
+		n_gt = int(popcount[gt_packed].sum(dtype = cupy.int64))
+		n_pred = int(popcount[pred_packed].sum(dtype = cupy.int64))
+	else:
+		TP = int(_POPCOUNT[gt_packed & pred_packed].sum(dtype = np.int64))
+		n_gt = int(_POPCOUNT[gt_packed].sum(dtype = np.int64))
+		n_pred = int(_POPCOUNT[pred_packed].sum(dtype = np.int64))
 
-gt_list = sorted(os.listdir(gt_folder))
-pred_list = sorted(os.listdir(pred_folder))
+	FN = n_gt - TP
+	FP = n_pred - TP
+	return np.array([n_voxels - TP - FN - FP, FP, FN, TP], np.int64)
 
-# get the lists of all ground truth and prediction files
-gt_list = [gt_folder + file for file in gt_list if file.endswith('_seg.nii.gz')]
-pred_list = [pred_folder + file for file in pred_list]
 
-logging.info(f"GT: {gt_list}")
-logging.info(f"Pred: {pred_list}")
+def _process_slice(mask_gt, mask_pred, spacing_mm):
+	"""Compute the metrics of one pair of masks.
 
-idx = 0
-vd_list = []  # list of volumetric dice scores
-sd_list = []  # list of surface dice scores
-h100_list = []  # list of hausdorff (100%) scores
-h95_list = []  # list of hausdorff (95%) scores
+	Returns the bounding box, the surface metrics and the volumetric dice.
+	They are printed by the driver with _print_report, so the reports of
+	parallel workers do not interleave.
+	"""
+	surface_distances = compute_surface_distances(mask_gt, mask_pred, spacing_mm)
+	surface_metrics = compute_surface_metrics(surface_distances, 95, 1)
 
-gt = np.array([])
-pred = np.array([])
+	return {"bbox_min": surface_distances["bbox_min"],
+	        "bbox_max": surface_distances["bbox_max"],
+	        "average_surface_distance": surface_metrics["average_surface_distance"],
+	        "h100": surface_metrics["hausdorff_100"],
+	        "h95": surface_metrics["robust_hausdorff"],
+	        "surface_overlap": surface_metrics["surface_overlap"],
+	        "surface_dice": surface_metrics["surface_dice"],
+	        "volumetric_dice": compute_dice_coefficient(mask_gt, mask_pred)}
 
-for gt_path, pred_path in zip(gt_list, pred_list):
 
+def _print_report(gt_path, pred_path, result):
+	"""Print the metrics of one case returned by _process_case."""
 	logging.info(f"GT: {gt_path}")
 	logging.info(f"Pred: {pred_path}")
 
-	load_gt = nib.load(gt_path)
-	load_pred = nib.load(pred_path)
-
-	mask_gt = np.array(load_gt.dataobj, dtype = bool)
-	mask_pred = np.array(load_pred.dataobj, dtype = bool)
-
-	if args.DynUNET == "No":  # remove the last dimension in the mask for U-Net
-		mask_pred = mask_pred[:, :, :, 0]
-
-	print("SHAPE GT ", np.shape(mask_gt), "SHAPE PREDICTION", np.shape(mask_pred))
-
-	if overlap:  # apply the overlap post-processing method
-		mask_pred = mask_pred & mask_gt
-
-	surface_distances = compute_surface_distances(mask_gt, mask_pred, spacing_mm)
-	print("average surface distance: {} mm".format(compute_average_surface_distance(surface_distances)))
-
-	h100 = compute_robust_hausdorff(surface_distances, 100)
-	print("hausdorff (100%):         {} mm".format(h100))
-
-	h95 = compute_robust_hausdorff(surface_distances, 95)
-	print("hausdorff (95%):          {} mm".format(h95))
+	print("SHAPE GT ", result["shape_gt"], "SHAPE PREDICTION", result["shape_pred"])
+	if result["bbox_min"] is not None:
+		print("bounding box min = {}".format(result["bbox_min"]))
+		print("bounding box max = {}".format(result["bbox_max"]))
 
-	print("surface overlap at 1mm:   {}".format(compute_surface_overlap_at_tolerance(surface_distances, 1)))
-
-	surface_dice = compute_surface_dice_at_tolerance(surface_distances, 1)
-	print("surface dice at 1mm:      {}".format(surface_dice))
-
-	volumetric_dice = compute_dice_coefficient(mask_gt, mask_pred)
-	print("volumetric dice:          {}".format(volumetric_dice))
+	print("average surface distance: {} mm".format(result["average_surface_distance"]))
+	print("hausdorff (100%):         {} mm".format(result["h100"]))
+	print("hausdorff (95%):          {} mm".format(result["h95"]))
+	print("surface overlap at 1mm:   {}".format(result["surface_overlap"]))
+	print("surface dice at 1mm:      {}".format(result["surface_dice"]))
+	print("volumetric dice:          {}".format(result["volumetric_dice"]))
 
 	print("")
 	print("expected average_distance_gt_to_pred = 1./6 * 2mm = {}mm".format(1. / 6 * 2))
 	print("expected volumetric dice: {}".format(2. * 100 * 100 * 100 / (100 * 100 * 100 + 102 * 100 * 100)))
 	print("")
 
-	# Go from N-D array to 1-D array acceptable by sklearn
-	mask_gt = mask_gt.ravel()
-	mask_pred = mask_pred.ravel()
-
-	gt = np.append(gt, mask_gt)
-	pred = np.append(pred, mask_pred)
 
-	if not np.isnan(volumetric_dice):
-		vd_list.append(volumetric_dice)
-	if not np.isnan(surface_dice):
-		sd_list.append(surface_dice)
-	if not np.isinf(h100):
-		h100_list.append(h100)
-	if not np.isinf(h95):
-		h95_list.append(h95)
+def _init_worker(n_threads):
+	"""Set up a worker process of the driver.
 
-print("Final Average Volumetric Dice - all slices:     {}".format(np.mean(np.array(vd_list))))
-print("Final Average Surface Dice - all slices:     {}".format(np.mean(np.array(sd_list))))
-print("Final Average Hausdorff 100 - all slices:     {}".format(np.mean(np.array(h100_list))))
-print("Final Average Hausdorff 95 - all slices:     {}".format(np.mean(np.array(h95_list))))
+	Spawned workers do not inherit the logging configuration of the parent.
+	Every worker gets its share of the cores (`n_threads`) for its
+	distance transforms and Numba kernels.
+	"""
+	logging.basicConfig(stream = sys.stdout, level = logging.INFO)
+	_set_num_threads(n_threads)
 
-fpr, tpr, thresholds = metrics.roc_curve(gt * 1, pred * 1)
-auc = metrics.auc(fpr, tpr)
 
-print("AUC: ", auc)
-print("FPR: ", fpr)
-print("TPR: ", tpr)
+def _process_case(gt_path, pred_path, spacing_mm, overlap, DynUNET, buffer_name, n_bytes, offset):
+	"""Compute the metrics of one ground truth / prediction pair.
 
-TN, FP, FN, TP = metrics.confusion_matrix(gt * 1, pred * 1).ravel()
+	Runs in a worker process. The masks needed for the ROC curve and confusion
+	matrix are bit packed into the shared ground truth / prediction buffers
+	(``n_bytes`` each) at byte ``offset``, and only the metrics (and the
+	shapes of the images) are returned.
+	"""
+	load_gt = nib.load(gt_path)
+	load_pred = nib.load(pred_path)
 
-print("TN, FP, FN, TP: ", TN, FP, FN, TP)
+	# read the voxel data once (memory-mapped when the file allows it)
+	data_gt = np.asanyarray(load_gt.dataobj)
+	if DynUNET == "No":  # remove the last dimension in the mask for U-Net
+		# slice the proxy so only the first channel is read
+		data_pred = np.asanyarray(load_pred.dataobj[:, :, :, 0])
+	else:
+		data_pred = np.asanyarray(load_pred.dataobj)
 
-print("Sensitivity: ", TP / (TP + FN))
-print("Specificity: ", TN / (TN + FP))
-print("Precision: ", TP / (TP + FP))
-print("F1: ", 2 * TP / (2 * TP + FP + FN))
+	# nibabel returns Fortran ordered data, the masks are converted to C order
+	# in the same pass as the bool conversion, so the kernels walk their
+	# innermost loops along contiguous memory
+	mask_gt = data_gt.astype(bool, order = "C")
+	if overlap:  # apply the overlap post-processing method
+		# (converts the prediction to bool in the same pass)
+		mask_pred = np.logical_and(data_pred, mask_gt, order = "C")
+	else:
+		mask_pred = data_pred.astype(bool, order = "C")
+
+	result = _process_slice(mask_gt, mask_pred, spacing_mm)
+	result["shape_gt"] = np.shape(data_gt)
+	result["shape_pred"] = np.shape(data_pred)
+
+	# store the masks with 8 voxels per byte in this case's slot of the
+	# shared buffers
+	buffers = shared_memory.SharedMemory(name = buffer_name)
+	gt, pred = np.ndarray((2, n_bytes), np.uint8, buffer = buffers.buf)
+	packed_size = (mask_gt.size + 7) // 8
+	gt[offset:offset + packed_size] = np.packbits(mask_gt, axis = None)
+	pred[offset:offset + packed_size] = np.packbits(mask_pred, axis = None)
+
+	# the views have to go before the shared memory can be closed
+	del gt, pred
+	buffers.close()
+
+	return result
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(
+		description = "Run Performance Metrics.")
+	parser.add_argument("--gt_folder", default = "",
+	                    type = str, help = "ground truth data folder")
+	parser.add_argument("--pred_folder", default = "",
+	                    type = str, help = "prediction folder")
+	parser.add_argument("--overlap", default = False,
+	                    type = bool, help = "apply overlap or not?")
+	parser.add_argument("--DynUNET", default = "No",
+	                    type = str, help = "check if it is DynUNET")
+	parser.add_argument("--workers", default = 0,
+	                    type = int, help = "number of worker processes (0: one per available CPU)")
+
+	args = parser.parse_args()
+	gt_folder = args.gt_folder
+	pred_folder = args.pred_folder
+	overlap = args.overlap
+
+	logging.basicConfig(stream = sys.stdout, level = logging.INFO)
+
+	spacing_mm = (2, 1, 1)
+
+	# get the lists of all ground truth and prediction files
+	# (os.scandir already knows the entry types, so no extra stat per file)
+	gt_list = sorted(entry.path for entry in os.scandir(gt_folder)
+	                 if entry.name.endswith('_seg.nii.gz') and entry.is_file())
+	pred_list = sorted(entry.path for entry in os.scandir(pred_folder) if entry.is_file())
+
+	logging.info(f"GT: {gt_list}")
+	logging.info(f"Pred: {pred_list}")
+
+	# running sums and counts of the scores, only the averages are reported
+	vd_sum, vd_n = 0.0, 0  # volumetric dice scores
+	sd_sum, sd_n = 0.0, 0  # surface dice scores
+	h100_sum, h100_n = 0.0, 0  # hausdorff (100%) scores
+	h95_sum, h95_n = 0.0, 0  # hausdorff (95%) scores
+
+	n_cases = min(len(gt_list), len(pred_list))
+
+	# all voxels of all cases go into the confusion matrix. The sizes are
+	# known from the image headers, so the workers can pack their masks
+	# (8 voxels per byte, every case starting at a byte boundary) directly
+	# into buffers in shared memory that are allocated once
+	sizes = [int(np.prod(nib.load(gt_path).shape)) for gt_path in gt_list[:n_cases]]
+	offsets = list(accumulate(((size + 7) // 8 for size in sizes), initial = 0))
+	n_bytes = offsets.pop()
+	buffers = shared_memory.SharedMemory(create = True, size = max(1, 2 * n_bytes))
+	try:
+		gt_packed, pred_packed = np.ndarray((2, n_bytes), np.uint8, buffer = buffers.buf)
+
+		# the cases are independent, so they are processed in parallel. The workers
+		# are spawned rather than forked, forking a process that already started
+		# the Numba (or CUDA) runtime is not safe
+		# every worker is multi-threaded itself, so the cores are split between
+		# them. On the GPU a single worker keeps one CUDA context on the device
+		workers = max(1, min(args.workers or _CPU_COUNT, n_cases))
+		if _GPU_AVAILABLE and workers > 1:
+			if args.workers:
+				logging.warning(f"--workers {args.workers} is overridden, the GPU is used by a single worker")
+			workers = 1
+		with ProcessPoolExecutor(max_workers = workers,
+		                         mp_context = multiprocessing.get_context("spawn"),
+		                         initializer = _init_worker,
+		                         initargs = (max(1, _CPU_COUNT // workers),)) as executor:
+			results = list(executor.map(_process_case, gt_list, pred_list, repeat(spacing_mm),
+			                            repeat(overlap), repeat(args.DynUNET),
+			                            repeat(buffers.name), repeat(n_bytes), offsets))
+
+		TN, FP, FN, TP = _confusion_counts(gt_packed, pred_packed, sum(sizes))
+	finally:
+		# the views have to go before the shared memory can be closed, also
+		# when a worker failed
+		gt_packed = pred_packed = None
+		buffers.close()
+		buffers.unlink()
+
+	for gt_path, pred_path, result in zip(gt_list, pred_list, results):
+		_print_report(gt_path, pred_path, result)
+
+		if not math.isnan(result["volumetric_dice"]):
+			vd_sum += result["volumetric_dice"]
+			vd_n += 1
+		if not math.isnan(result["surface_dice"]):
+			sd_sum += result["surface_dice"]
+			sd_n += 1
+		if not math.isinf(result["h100"]):
+			h100_sum += result["h100"]
+			h100_n += 1
+		if not math.isinf(result["h95"]):
+			h95_sum += result["h95"]
+			h95_n += 1
+
+	print("Final Average Volumetric Dice - all slices:     {}".format(vd_sum / vd_n if vd_n else float("nan")))
+	print("Final Average Surface Dice - all slices:     {}".format(sd_sum / sd_n if sd_n else float("nan")))
+	print("Final Average Hausdorff 100 - all slices:     {}".format(h100_sum / h100_n if h100_n else float("nan")))
+	print("Final Average Hausdorff 95 - all slices:     {}".format(h95_sum / h95_n if h95_n else float("nan")))
+
+	sensitivity = TP / (TP + FN)
+	specificity = TN / (TN + FP)
+
+	# the predictions are binary, so the ROC curve has a single point between
+	# (0, 0) and (1, 1) and its area follows from the confusion matrix,
+	# without roc_curve sorting all voxels
+	fpr = np.array([0, FP / (FP + TN), 1])
+	tpr = np.array([0, sensitivity, 1])
+	auc = (sensitivity + specificity) / 2
+
+	print("AUC: ", auc)
+	print("FPR: ", fpr)
+	print("TPR: ", tpr)
+
+	print("TN, FP, FN, TP: ", TN, FP, FN, TP)
+
+	print("Sensitivity: ", sensitivity)
+	print("Specificity: ", specificity)
+	print("Precision: ", TP / (TP + FP))
+	print("F1: ", 2 * TP / (2 * TP + FP + FN))